@@ -5,6 +5,7 @@ from io import BytesIO
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import json
+from ledger_math import signed_quantity
 
 # Initialize session data
 if 'data' not in st.session_state:
@@ -142,10 +143,7 @@ else:
 st.subheader("📊 Current Stock by Size (mm)")
 if not st.session_state.data.empty:
     summary = st.session_state.data.copy()
-    summary['Net Quantity'] = summary.apply(
-        lambda row: row['Quantity'] if row['Type'] == 'Inward' else -row['Quantity'], 
-        axis=1
-    )
+    summary['Net Quantity'] = signed_quantity(summary)
     stock_summary = summary.groupby('Size (mm)')['Net Quantity'].sum().reset_index()
     stock_summary = stock_summary[stock_summary['Net Quantity'] != 0]
     if not stock_summary.empty:
@@ -0,0 +1,169 @@
+# backup_log.py
+
+import json
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from ledger_ops import frame_rows
+from sheet_sync import LEDGER_COLUMNS
+
+BACKUP_COLUMNS = ["Timestamp", "Op", "ID", "Row"]
+
+# Write a full snapshot after this many logged changes so a rebuild only
+# has to replay the tail of the log.
+SNAPSHOT_EVERY = 500
+
+# Snapshots kept in the log: older ones and their changes are deleted when a
+# new snapshot is written, so the log keeps at least SNAPSHOT_EVERY changes
+# of history for rebuild_ledger(as_of=...) without growing without bound.
+KEEP_SNAPSHOTS = 2
+
+# Log record kinds besides the ledger ops:
+# "snapshot" starts a snapshot (Row holds its size) and resets the state,
+# "keep" is one ledger row inside a snapshot.
+SNAPSHOT = "snapshot"
+KEEP = "keep"
+
+# Changes logged since the last snapshot, per worksheet
+_since_snapshot = {}
+_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _sheet_key(ws):
+    return (ws.spreadsheet.id, ws.id)
+
+
+def snapshot_records(df, ts=None):
+    """Log records for a compacted snapshot of the ledger"""
+    ts = ts or _now()
+    rows = frame_rows(df)
+    records = [[ts, SNAPSHOT, "", json.dumps({"rows": len(rows)})]]
+    for entry_id, cells in rows.items():
+        records.append([ts, KEEP, entry_id, json.dumps(cells, default=str)])
+    return records
+
+
+def op_records(journal_records):
+    """Log records for journaled ledger ops"""
+    return [
+        [r["ts"], r["op"], r["id"], "" if r.get("row") is None else json.dumps(r["row"], default=str)]
+        for r in journal_records
+    ]
+
+
+def _changes_since_snapshot(ws):
+    """Count log rows after the last snapshot (reads the Op column once per process)"""
+    key = _sheet_key(ws)
+    with _lock:
+        if key in _since_snapshot:
+            return _since_snapshot[key]
+    ops = ws.col_values(2)
+    if not ops or ops[0] != "Op":
+        return None  # not a change log yet
+    count = 0
+    for op in reversed(ops[1:]):
+        if op == SNAPSHOT:
+            break
+        if op != KEEP:
+            count += 1
+    else:
+        return None  # no snapshot to rebuild from
+    with _lock:
+        _since_snapshot[key] = count
+    return count
+
+
+def start_log(ws, df):
+    """Reset the worksheet to a change log holding one snapshot of df"""
+    ws.clear()
+    ws.update([BACKUP_COLUMNS] + snapshot_records(df))
+    with _lock:
+        _since_snapshot[_sheet_key(ws)] = 0
+
+
+def append_changes(ws, journal_records, df):
+    """Append the flushed ops, plus a snapshot of df when one is due.
+
+    df must be the ledger with every op in journal_records applied.
+    Returns the number of log rows written.
+    """
+    count = _changes_since_snapshot(ws)
+    if count is None:
+        start_log(ws, df)
+        return len(df) + 1
+
+    records = op_records(journal_records)
+    count += len(records)
+    snapshot = count >= SNAPSHOT_EVERY
+    if snapshot:
+        records += snapshot_records(df)
+        count = 0
+    if records:
+        ws.append_rows(records, table_range="A1", value_input_option="RAW")
+    with _lock:
+        _since_snapshot[_sheet_key(ws)] = count
+    if snapshot:
+        compact_log(ws)
+    return len(records)
+
+
+def compact_log(ws, keep=KEEP_SNAPSHOTS):
+    """Delete the log rows before the oldest of the last `keep` snapshots.
+
+    Returns the number of rows deleted.
+    """
+    ops = ws.col_values(2)
+    starts = [i for i, op in enumerate(ops) if op == SNAPSHOT]
+    if len(starts) <= keep:
+        return 0
+    # Sheet rows are 1-based and row 1 is the header
+    first_kept = starts[-keep] + 1
+    ws.delete_rows(2, first_kept - 1)
+    return first_kept - 2
+
+
+def replay(log_rows, as_of=None):
+    """Ledger rows (ID -> cells) after replaying log rows up to as_of"""
+    rows = {}
+    for ts, op, entry_id, payload in log_rows:
+        if as_of is not None and str(ts) > as_of:
+            break
+        if op == SNAPSHOT:
+            rows = {}
+        elif op == "delete":
+            rows.pop(entry_id, None)
+        elif op in (KEEP, "insert", "update"):
+            rows[entry_id] = json.loads(payload)
+    return rows
+
+
+def rebuild_ledger(ws, as_of=None):
+    """Rebuild the ledger as it stood at as_of ('YYYY-MM-DD HH:MM:SS', default now).
+
+    Replays from the last snapshot taken at or before as_of; the log only
+    reaches back to its oldest kept snapshot (see KEEP_SNAPSHOTS).
+    """
+    values = ws.get_all_values()
+    if not values or values[0][:len(BACKUP_COLUMNS)] != BACKUP_COLUMNS:
+        raise ValueError("Backup worksheet is not a change log")
+    log_rows = [(r + [""] * 4)[:4] for r in values[1:]]
+    if as_of is not None and log_rows and str(log_rows[0][0]) > as_of:
+        raise ValueError(f"Backup history starts at {log_rows[0][0]}")
+
+    start = 0
+    for i, (ts, op, _, _) in enumerate(log_rows):
+        if as_of is not None and str(ts) > as_of:
+            break
+        if op == SNAPSHOT:
+            start = i
+
+    rows = replay(log_rows[start:], as_of)
+    if not rows:
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+    return pd.DataFrame(list(rows.values()), columns=LEDGER_COLUMNS)
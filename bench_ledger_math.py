@@ -0,0 +1,62 @@
+# bench_ledger_math.py
+# Row-wise Net lambdas vs ledger_math at several ledger sizes.
+# Usage: python bench_ledger_math.py [rows ...]   (default 10000 100000 1000000)
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ledger_math import signed_quantity, stock_totals
+from ledger_schema import coerce_ledger
+
+
+def make_ledger(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return coerce_ledger(pd.DataFrame({
+        "Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 700, n), unit="D"),
+        "Size (mm)": rng.choice([35, 40, 50, 70, 100, 130, 225, 1803, 2003], n),
+        "Type": rng.choice(["Inward", "Outgoing"], n),
+        "Quantity": rng.integers(1, 500, n),
+        "Remarks": rng.choice(["", "Ajay", "Vinod", "Suresh"], n),
+        "Status": rng.choice(["Current", "Future"], n, p=[0.9, 0.1]),
+        "Pending": rng.random(n) < 0.1,
+        "ID": [str(i) for i in range(n)],
+    }))
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def old_stock(df):
+    current = df[(df["Status"] == "Current") & (~df["Pending"])].copy()
+    current["Net"] = current.apply(
+        lambda x: x["Quantity"] if x["Type"] == "Inward" else -x["Quantity"], axis=1
+    )
+    return current.groupby("Size (mm)")["Net"].sum()
+
+
+def main(sizes):
+    print(f"{'rows':>9}  {'apply Net':>10}  {'signed_qty':>10}  {'speedup':>8}  {'old stock':>10}  {'totals':>8}  {'speedup':>8}")
+    for n in sizes:
+        df = make_ledger(n)
+        repeat = 1 if n >= 1_000_000 else 3
+        apply_t = timed(lambda: df.apply(
+            lambda x: x["Quantity"] if x["Type"] == "Inward" else -x["Quantity"], axis=1
+        ), repeat)
+        vec_t = timed(lambda: signed_quantity(df), repeat)
+        old_t = timed(lambda: old_stock(df), repeat)
+        tot_t = timed(lambda: stock_totals(df), repeat)
+        print(f"{n:>9}  {apply_t:>9.4f}s  {vec_t:>9.4f}s  {apply_t / vec_t:>7.0f}x  "
+              f"{old_t:>9.4f}s  {tot_t:>7.4f}s  {old_t / tot_t:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
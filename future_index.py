@@ -0,0 +1,96 @@
+# future_index.py
+
+import threading
+from bisect import bisect_left, insort
+
+import pandas as pd
+
+from ledger_ops import row_cells
+from stock_aggregates import cell_int
+from stock_index import day_ordinal
+
+
+def _is_unmatched(cells):
+    """Future Inward rows with no supplier yet, which a plain Inward entry may be fulfilling"""
+    return (
+        str(cells.get("Type", "")).strip() == "Inward"
+        and str(cells.get("Status", "")).strip().lower() == "future"
+        and str(cells.get("Remarks", "")).strip() == ""
+    )
+
+
+class FutureIndex:
+    """Unmatched Future Inward entries per size, in date order.
+
+    Kept in step with the ledger through apply(), so the conflict check
+    on an Inward entry only reads the entries for its size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_size = {}
+        # ID -> (size, sort key, sheet cells) for every indexed entry
+        self._entries = {}
+        self._seq = 0
+
+    def rebuild(self, df):
+        by_size, entries = {}, {}
+        seq = 0
+        if df is not None and not df.empty:
+            candidates = df[(df["Type"] == "Inward") & (df["Status"] == "Future")]
+            for seq, row in enumerate(candidates.to_dict("records")):
+                cells = row_cells(row)
+                if _is_unmatched(cells):
+                    self._enter(by_size, entries, cells, seq)
+            seq = len(df)
+        with self._lock:
+            self._by_size, self._entries, self._seq = by_size, entries, seq
+
+    @staticmethod
+    def _enter(by_size, entries, cells, seq):
+        size = cell_int(cells.get("Size (mm)"))
+        day = day_ordinal(cells.get("Date"))
+        # Undated entries go last, as they do when sorting by Date
+        order = (float("inf") if day is None else day, seq, str(cells.get("ID", "")))
+        insort(by_size.setdefault(size, []), order)
+        entries[order[2]] = (size, order, cells)
+
+    def _leave(self, entry_id):
+        found = self._entries.pop(entry_id, None)
+        if found is None:
+            return None
+        size, order, _ = found
+        queue = self._by_size[size]
+        del queue[bisect_left(queue, order)]
+        if not queue:
+            del self._by_size[size]
+        return order[1]
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                seq = self._leave(op.entry_id)
+                if op.after and _is_unmatched(op.after):
+                    if seq is None:
+                        seq = self._seq
+                        self._seq += 1
+                    self._enter(self._by_size, self._entries, dict(op.after, ID=op.entry_id), seq)
+
+    def cells(self, entry_id):
+        """Sheet cells of an indexed entry (None if it is not an unmatched Future entry)"""
+        with self._lock:
+            found = self._entries.get(entry_id)
+            return dict(found[2]) if found else None
+
+    def matches(self, size):
+        """Unmatched Future entries for size, oldest first: Date, Quantity, Status indexed by ID"""
+        with self._lock:
+            rows = [self._entries[entry_id][2] for _, _, entry_id in self._by_size.get(int(size), [])]
+        return pd.DataFrame(
+            {
+                "Date": pd.to_datetime([r.get("Date") for r in rows], errors="coerce"),
+                "Quantity": [cell_int(r.get("Quantity")) for r in rows],
+                "Status": [r.get("Status", "") for r in rows],
+            },
+            index=pd.Index([r.get("ID", "") for r in rows], name="ID"),
+        )
@@ -1,18 +1,129 @@
-def get_gsheet():
-    scope = ["https://spreadsheets.google.com/feeds", 
-             "https://www.googleapis.com/auth/drive"]
-    
-    try:
-        # Get credentials from Streamlit secrets
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        
-        # Ensure the private key is properly formatted
-        if "\\n" in creds_dict["private_key"]:
-            creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-            
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        return client.open("Rotor Log").sheet1
-    except Exception as e:
-        st.error(f"Failed to connect to Google Sheets: {str(e)}")
-        return None
+# gsheet.py
+
+import json
+import threading
+import time
+
+import gspread
+import streamlit as st
+from oauth2client.service_account import ServiceAccountCredentials
+
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+SPREADSHEET_NAME = "Rotor Log"
+
+# Service account tokens last an hour; re-authorize a little before that
+TOKEN_TTL = 45 * 60
+
+# One authorized client and its spreadsheet/worksheet handles per process,
+# shared by every browser session and the background writer.
+_lock = threading.RLock()
+_client = None
+_authorized_at = 0.0
+_spreadsheets = {}
+_worksheets = {}
+_titles = {}
+
+
+def _credentials():
+    raw = st.secrets["gcp_service_account"]
+    creds_dict = json.loads(raw) if isinstance(raw, str) else dict(raw)
+    creds_dict["private_key"] = creds_dict["private_key"].replace("\\\\n", "\n").replace("\\n", "\n")
+    return ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
+
+
+def reset_client():
+    """Forget the client and every cached handle (next call re-authorizes)"""
+    global _client, _authorized_at
+    with _lock:
+        _client = None
+        _authorized_at = 0.0
+        _spreadsheets.clear()
+        _worksheets.clear()
+        _titles.clear()
+
+
+def get_client():
+    """Authorized gspread client, refreshed before its token expires"""
+    global _client, _authorized_at
+    with _lock:
+        if _client is None or time.monotonic() - _authorized_at > TOKEN_TTL:
+            _spreadsheets.clear()
+            _worksheets.clear()
+            _titles.clear()
+            _client = gspread.authorize(_credentials())
+            _authorized_at = time.monotonic()
+        return _client
+
+
+def get_spreadsheet(name=SPREADSHEET_NAME):
+    """Spreadsheet handle, opened by name once per client"""
+    with _lock:
+        client = get_client()
+        if name not in _spreadsheets:
+            _spreadsheets[name] = client.open(name)
+        return _spreadsheets[name]
+
+
+def get_worksheet(title, name=SPREADSHEET_NAME, create=False, rows="1000", cols="20"):
+    """Worksheet handle by title. Raises gspread.WorksheetNotFound unless create is set."""
+    with _lock:
+        ss = get_spreadsheet(name)
+        key = (name, title)
+        if key not in _worksheets:
+            try:
+                _worksheets[key] = ss.worksheet(title)
+            except gspread.WorksheetNotFound:
+                if not create:
+                    raise
+                _worksheets[key] = ss.add_worksheet(title=title, rows=rows, cols=cols)
+                if name in _titles:
+                    _titles[name].add(title)
+        return _worksheets[key]
+
+
+def worksheet_titles(name=SPREADSHEET_NAME):
+    """Titles of every worksheet in the spreadsheet, listed once per client"""
+    with _lock:
+        ss = get_spreadsheet(name)
+        if name not in _titles:
+            _titles[name] = {ws.title for ws in ss.worksheets()}
+        return set(_titles[name])
+
+
+def _a1_title(title):
+    return "'" + title.replace("'", "''") + "'"
+
+
+def get_values(ws, params=None):
+    """Every cell of a worksheet as rows, with optional render params"""
+    response = ws.spreadsheet.values_get(_a1_title(ws.title), params=params)
+    return response.get("values", [])
+
+
+def get_values_batch(titles, name=SPREADSHEET_NAME, params=None):
+    """Cell values of several worksheets in one request, as {title: rows}.
+
+    Worksheets that don't exist are left out rather than failing the batch.
+    """
+    present = [t for t in titles if t in worksheet_titles(name)]
+    if not present:
+        return {}
+    ranges = [_a1_title(t) for t in present]
+    response = get_spreadsheet(name).values_batch_get(ranges, params=params)
+    return {
+        title: value_range.get("values", [])
+        for title, value_range in zip(present, response.get("valueRanges", []))
+    }
+
+
+def get_gsheet(name=SPREADSHEET_NAME):
+    """First worksheet of the spreadsheet (the rotor movement log)"""
+    with _lock:
+        ss = get_spreadsheet(name)
+        key = (name, None)
+        if key not in _worksheets:
+            _worksheets[key] = ss.sheet1
+        return _worksheets[key]
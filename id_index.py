@@ -0,0 +1,46 @@
+# id_index.py
+
+
+class IdIndex:
+    """ID -> row label of the shared ledger frame.
+
+    Labels are handed out in insert order and never reused, so a row keeps
+    its label through edits and through deletes of other rows: a delete
+    just leaves a tombstone (a gap in the labels). Once the gaps grow past
+    max_gap_ratio of the live rows, needs_compaction() says so and a
+    rebuild() numbers the rows 0..n-1 again.
+    """
+
+    def __init__(self, max_gap_ratio=0.25, min_gaps=1024):
+        self.max_gap_ratio = max_gap_ratio
+        self.min_gaps = min_gaps
+        self._labels = {}
+        self._next = 0
+        self._tombstones = 0
+
+    def rebuild(self, ids):
+        """Number ids 0..n-1 in order, dropping every tombstone"""
+        ids = list(ids)
+        self._labels = {entry_id: label for label, entry_id in enumerate(ids)}
+        self._next = len(ids)
+        self._tombstones = 0
+
+    def apply(self, ops):
+        for op in ops:
+            if op.kind == "delete":
+                if self._labels.pop(op.entry_id, None) is not None:
+                    self._tombstones += 1
+            elif op.entry_id not in self._labels:
+                self._labels[op.entry_id] = self._next
+                self._next += 1
+
+    def get(self, entry_id):
+        """Label of entry_id (None if it is not in the ledger)"""
+        return self._labels.get(entry_id)
+
+    def labels(self, ids):
+        """Labels for ids, in order, e.g. the index of a frame built from them"""
+        return [self._labels[entry_id] for entry_id in ids]
+
+    def needs_compaction(self):
+        return self._tombstones > max(self.min_gaps, self.max_gap_ratio * len(self._labels))
@@ -0,0 +1,109 @@
+# inventory_context.py
+
+import pandas as pd
+
+
+def _dates(series, missing="Unknown"):
+    return series.dt.strftime("%Y-%m-%d").fillna(missing)
+
+
+def _records(df, columns):
+    """List of plain dicts (native Python values) with columns renamed per the mapping"""
+    if "date" in columns:
+        # Formatting dates is the slow part, so only for rows that are shown
+        df = df.assign(date=_dates(df["_at"]))
+    return df[list(columns)].rename(columns=columns).to_dict("records")
+
+
+def build_inventory_context(df, totals, price_of, latest=5):
+    """Everything the assistants show about the ledger, from one pass over it.
+
+    totals is the per-size frame from StockAggregates (pending orders
+    there are pending Outgoing rows, as below); price_of(size)
+    gives the unit price. Lists hold plain dicts ready for json.dumps;
+    future_incoming is soonest first, latest_* newest first.
+    """
+    if df is None or df.empty:
+        return {
+            "stock_summary": [],
+            "pending_orders": [],
+            "pending_by_buyer": {},
+            "future_incoming": [],
+            "latest_incoming": [],
+            "latest_outgoing": [],
+            "buyers": [],
+            "total_sizes_tracked": 0,
+            "total_buyers": 0,
+            "total_suppliers": 0,
+            "total_transactions": 0,
+            "total_quantity": 0,
+            "date_range": {"from": "Unknown", "to": "Unknown"},
+        }
+
+    prices = {int(size): price_of(int(size)) for size in df["Size (mm)"].unique()}
+    unit_price = df["Size (mm)"].map(prices).astype(float)
+
+    view = pd.DataFrame({
+        "size": df["Size (mm)"].astype(int),
+        "quantity": df["Quantity"].astype(int),
+        "party": df["Remarks"].astype(str),
+        "status": df["Status"].astype(str),
+        "pending": df["Pending"].astype(bool),
+        "value": unit_price * df["Quantity"],
+        "_at": df["Date"],
+    })
+    inward = (df["Type"] == "Inward").to_numpy()
+    outgoing = (df["Type"] == "Outgoing").to_numpy()
+    pending = outgoing & df["Pending"].to_numpy(dtype=bool)
+    future = inward & (df["Status"] == "Future").to_numpy()
+
+    live = totals[(totals["Stock"] > 0) | (totals["Pending Outgoing"] > 0) | (totals["Coming In"] > 0)]
+    stock_summary = [
+        {
+            "size": int(size),
+            "current_stock": int(stock),
+            "pending_orders": int(pending_out),
+            "future_incoming": int(coming),
+            "value": float(prices[int(size)] * stock),
+        }
+        for size, stock, pending_out, coming in live[["Size (mm)", "Stock", "Pending Outgoing", "Coming In"]].itertuples(index=False, name=None)
+    ]
+
+    pending_view = view[pending]
+    pending_orders = _records(pending_view, {"date": "date", "size": "size", "quantity": "quantity", "party": "buyer", "value": "value"})
+    pending_by_buyer = {
+        str(buyer): {
+            "total": int(group["quantity"].sum()),
+            "orders": _records(group, {"size": "size", "quantity": "quantity", "date": "date"}),
+        }
+        for buyer, group in pending_view.groupby("party", sort=False)
+    }
+
+    future_view = view[future].sort_values("_at", kind="stable")
+    future_incoming = _records(future_view, {"date": "date", "size": "size", "quantity": "quantity", "party": "supplier", "value": "value"})
+
+    incoming_view = view[inward].sort_values("_at", ascending=False, kind="stable")
+    outgoing_view = view[outgoing].sort_values("_at", ascending=False, kind="stable")
+    latest_incoming = _records(incoming_view.head(latest), {"date": "date", "party": "supplier", "size": "size", "quantity": "quantity", "status": "status"})
+    latest_outgoing = _records(outgoing_view.head(latest), {"date": "date", "party": "buyer", "size": "size", "quantity": "quantity", "pending": "pending"})
+
+    dates = df["Date"].dropna()
+    return {
+        "stock_summary": stock_summary,
+        "pending_orders": pending_orders,
+        "pending_by_buyer": pending_by_buyer,
+        "future_incoming": future_incoming,
+        "latest_incoming": latest_incoming,
+        "latest_outgoing": latest_outgoing,
+        "buyers": [str(b) for b in df.loc[outgoing, "Remarks"].dropna().unique()],
+        "total_sizes_tracked": int(df["Size (mm)"].nunique()),
+        "total_buyers": int(df.loc[outgoing, "Remarks"].nunique(dropna=False)),
+        "total_suppliers": int(df.loc[inward, "Remarks"].nunique(dropna=False)),
+        "total_transactions": len(df),
+        "total_quantity": int(df["Quantity"].sum()),
+        "date_range": {
+            "from": dates.min().strftime("%Y-%m-%d") if not dates.empty else "Unknown",
+            "to": dates.max().strftime("%Y-%m-%d") if not dates.empty else "Unknown",
+        },
+    }
+
@@ -0,0 +1,199 @@
+# ledger_cache.py
+
+import threading
+
+import pandas as pd
+
+from id_index import IdIndex
+from ledger_ops import LedgerOp, apply_to_rows, frame_rows
+from sheet_sync import LEDGER_COLUMNS
+
+# pandas >= 3 always copies on write, so sessions can share one frame's
+# memory through shallow copies; older pandas gets real copies.
+_SHALLOW_VIEWS = int(pd.__version__.split(".")[0]) >= 3
+
+
+class SharedLedger:
+    """One ledger DataFrame per process, shared by every session.
+
+    version goes up on every change so sessions can tell when their view
+    is stale; revision is the sheet's modifiedTime when the frame last
+    matched Google Sheets, so reloads can skip unchanged sheets.
+
+    prepare(df) types a frame of sheet cells: the whole ledger on
+    replace(), only the rows an op touches on apply().
+
+    Derived structures (anything with rebuild(df) and apply(ops)) can be
+    attached; they are rebuilt on replace() and fed every op on apply().
+
+    Row labels are stable across apply() (see IdIndex), so locate() finds
+    a row by ID in the shared frame or in a session's view of it.
+    """
+
+    def __init__(self, prepare=None):
+        self._lock = threading.RLock()
+        self._prepare = prepare or (lambda df: df)
+        self._df = None
+        self._rows = None
+        self._derived = []
+        self._ids = IdIndex()
+        self.version = 0
+        self.revision = None
+        # Set while the frame comes from a local snapshot that could not
+        # yet be checked against Google Sheets
+        self.snapshot_at = None
+        self.reconcile_error = None
+
+    @property
+    def lock(self):
+        """Hold to make a journal append and apply() (or a reload) one step"""
+        return self._lock
+
+    def attach(self, derived):
+        """Keep derived in step with the ledger from now on; returns it"""
+        with self._lock:
+            if self._df is not None:
+                derived.rebuild(self._df)
+            self._derived.append(derived)
+        return derived
+
+    def loaded(self):
+        return self._df is not None
+
+    def view(self):
+        """(frame, version) for a session; the frame is safe to modify"""
+        with self._lock:
+            if self._df is None:
+                return None, self.version
+            return self._df.copy(deep=not _SHALLOW_VIEWS), self.version
+
+    def frame(self):
+        """The shared frame itself (read-only)"""
+        with self._lock:
+            return self._df
+
+    def rows(self):
+        """ID -> sheet cells of the shared frame (a private copy)"""
+        with self._lock:
+            if self._rows is None:
+                self._rows = frame_rows(self._df)
+            return dict(self._rows)
+
+    def locate(self, entry_id):
+        """Row label of entry_id in the shared frame (None if it is not there)"""
+        with self._lock:
+            return self._ids.get(entry_id)
+
+    def replace(self, df, revision=None):
+        with self._lock:
+            self._df = self._prepare(df.reset_index(drop=True))
+            self._ids.rebuild(self._df["ID"].tolist())
+            self._rows = None
+            self.version += 1
+            self.revision = revision
+            for derived in self._derived:
+                derived.rebuild(self._df)
+            return self.version
+
+    def apply(self, ops):
+        """Apply LedgerOps from one session so every session sees them.
+
+        Only the touched rows are built and prepared; they are spliced into
+        the shared frame by label, so a mutation costs the rows it touches
+        (plus a column copy-on-write), not a rebuild of the ledger.
+        """
+        if not ops:
+            return self.version
+        with self._lock:
+            if self._rows is None:
+                self._rows = frame_rows(self._df)
+            touched = list(dict.fromkeys(op.entry_id for op in ops))
+            old_labels = {entry_id: self._ids.get(entry_id) for entry_id in touched}
+            # Re-base each op on the row as it is here, not as the editing
+            # session last saw it, so derived totals stay exact
+            rebased = []
+            for op in ops:
+                op = LedgerOp(op.kind, op.entry_id, self._rows.get(op.entry_id), op.after)
+                apply_to_rows(self._rows, [op])
+                rebased.append(op)
+            self._ids.apply(rebased)
+            drop, updates, inserts = [], [], []
+            for entry_id in touched:
+                old, new = old_labels[entry_id], self._ids.get(entry_id)
+                if old is not None and old != new:
+                    drop.append(old)
+                if new is not None:
+                    (updates if new == old else inserts).append((new, self._rows[entry_id]))
+            # New labels are handed out in order, so this appends rows in
+            # the order they entered the ledger
+            df = self._splice(drop, updates, sorted(inserts, key=lambda item: item[0]))
+            if self._ids.needs_compaction():
+                self._ids.rebuild(df["ID"].tolist())
+                df.index = pd.RangeIndex(len(df))
+            self._df = df
+            self.version += 1
+            for derived in self._derived:
+                derived.apply(rebased)
+            return self.version
+
+    def _splice(self, drop, updates, inserts):
+        """The shared frame with rows dropped, updated and appended by label"""
+        df = self._df
+        if df is None:
+            df = self._prepare(pd.DataFrame(columns=LEDGER_COLUMNS))
+        # A private copy to write into: readers may still hold the old frame
+        df = df.drop(index=drop) if drop else df.copy(deep=not _SHALLOW_VIEWS)
+        changed = updates + inserts
+        if not changed:
+            return df
+        new = self._prepare(pd.DataFrame([cells for _, cells in changed], columns=LEDGER_COLUMNS))
+        new.index = pd.Index([label for label, _ in changed], dtype="int64")
+        for name in df.columns:
+            if isinstance(df[name].dtype, pd.CategoricalDtype) and isinstance(new[name].dtype, pd.CategoricalDtype):
+                extra = [c for c in new[name].cat.categories if c not in df[name].cat.categories]
+                if extra:
+                    df[name] = df[name].cat.add_categories(extra)
+                new[name] = new[name].cat.set_categories(df[name].cat.categories)
+            elif new[name].dtype != df[name].dtype and len(df):
+                new[name] = new[name].astype(df[name].dtype)
+        if updates:
+            labels = [label for label, _ in updates]
+            for name in df.columns:
+                values = new.loc[labels, name]
+                # Writing a column copies it; skip the ones the ops left alone
+                if not values.equals(df.loc[labels, name]):
+                    df.loc[labels, name] = values.to_numpy()
+        if inserts:
+            appended = new.iloc[len(updates):]
+            df = appended if df.empty else pd.concat([df, appended])
+        return df
+
+    def mark_revision(self, before, after, rewritten=False):
+        """Adopt the sheet's new revision after our own write, unless someone else wrote first.
+
+        A full rewrite leaves nothing of anyone else's on the sheet, so it is
+        adopted either way.
+        """
+        with self._lock:
+            if rewritten or (before is not None and before == self.revision):
+                self.revision = after
+
+
+class VersionedCache:
+    """The last value built, handed out again while its key is unchanged.
+
+    Key it on the ledger version (plus anything else the value depends
+    on, such as prices or today's date) so repeated reads are free.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._value = None
+
+    def get(self, key, build):
+        with self._lock:
+            if self._value is None or self._key != key:
+                self._value = build()
+                self._key = key
+            return self._value
@@ -0,0 +1,92 @@
+# ledger_math.py
+
+import numpy as np
+import pandas as pd
+
+SIZE = "Size (mm)"
+
+
+def quantity(df):
+    """Quantity as an int64 array (0 where blank)"""
+    qty = df["Quantity"]
+    if not pd.api.types.is_numeric_dtype(qty):
+        qty = pd.to_numeric(qty, errors="coerce")
+    return qty.fillna(0).to_numpy(dtype=np.int64)
+
+
+def _is(df, column, value, default):
+    """Boolean mask of df[column] == value (default when the column is missing)"""
+    if column not in df.columns:
+        return np.full(len(df), default, dtype=bool)
+    return (df[column] == value).to_numpy(dtype=bool, na_value=False)
+
+
+def _pending(df):
+    if "Pending" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df["Pending"].fillna(False).to_numpy(dtype=bool)
+
+
+def signed_quantity(df):
+    """Quantity with Inward positive and everything else negative"""
+    qty = quantity(df)
+    return np.where(_is(df, "Type", "Inward", False), qty, -qty)
+
+
+def stock_mask(df):
+    """Rows that count towards stock on hand: current and not pending"""
+    return _is(df, "Status", "Current", True) & ~_pending(df)
+
+
+def pending_mask(df):
+    """Current rows still waiting to go out"""
+    return _is(df, "Status", "Current", True) & _pending(df)
+
+
+def coming_mask(df):
+    """Future Inward rows"""
+    return _is(df, "Status", "Future", False) & _is(df, "Type", "Inward", False)
+
+
+def future_mask(df):
+    """Future rows of either type (the Stock Summary's coming rotors)"""
+    return _is(df, "Status", "Future", False)
+
+
+def pending_outgoing_mask(df):
+    """Pending Outgoing rows of either status (the assistants' pending orders)"""
+    return _is(df, "Type", "Outgoing", False) & _pending(df)
+
+
+def _by_size(df, values):
+    return pd.Series(values, index=df.index).groupby(df[SIZE].to_numpy()).sum()
+
+
+def net_stock(df):
+    """Stock on hand per size"""
+    return _by_size(df, np.where(stock_mask(df), signed_quantity(df), 0))
+
+
+def pending_out(df):
+    """Pending quantity per size"""
+    return _by_size(df, np.where(pending_mask(df), quantity(df), 0))
+
+
+def coming_in(df):
+    """Future inward quantity per size"""
+    return _by_size(df, np.where(coming_mask(df), quantity(df), 0))
+
+
+def stock_totals(df):
+    """Size (mm), Rows, Stock, Pending Out, Coming In, Future, Pending Outgoing for every size in df, sorted by size"""
+    qty = quantity(df)
+    parts = pd.DataFrame({
+        SIZE: df[SIZE].to_numpy(),
+        "Rows": 1,
+        "Stock": np.where(stock_mask(df), signed_quantity(df), 0),
+        "Pending Out": np.where(pending_mask(df), qty, 0),
+        "Coming In": np.where(coming_mask(df), qty, 0),
+        "Future": np.where(future_mask(df), qty, 0),
+        "Pending Outgoing": np.where(pending_outgoing_mask(df), qty, 0),
+    })
+    return parts.groupby(SIZE, sort=True).sum().reset_index()
@@ -0,0 +1,65 @@
+# ledger_ops.py
+
+from collections import namedtuple
+
+import pandas as pd
+
+from sheet_sync import LEDGER_COLUMNS, to_cell
+
+# kind is "insert", "update" or "delete"; before/after are {column: cell}
+# dicts as stored on the sheet, None where the row does not exist.
+LedgerOp = namedtuple("LedgerOp", ["kind", "entry_id", "before", "after"])
+
+
+def row_cells(row, columns=LEDGER_COLUMNS):
+    """Sheet cells for one ledger row (dict or Series)"""
+    return {c: to_cell(row.get(c, "")) for c in columns}
+
+
+def frame_rows(df, columns=LEDGER_COLUMNS):
+    """Map ID -> sheet cells for every row of a ledger DataFrame"""
+    if df is None or df.empty:
+        return {}
+    df = df.copy()
+    for c in columns:
+        if c not in df.columns:
+            df[c] = ""
+    return {
+        str(row["ID"]): {c: to_cell(row[c]) for c in columns}
+        for row in df[columns].to_dict("records")
+    }
+
+
+def ops_between(before, after):
+    """Ops turning one ID -> cells mapping into another"""
+    ops = []
+    for entry_id, cells in after.items():
+        old = before.get(entry_id)
+        if old is None:
+            ops.append(LedgerOp("insert", entry_id, None, cells))
+        elif old != cells:
+            ops.append(LedgerOp("update", entry_id, old, cells))
+    for entry_id, cells in before.items():
+        if entry_id not in after:
+            ops.append(LedgerOp("delete", entry_id, cells, None))
+    return ops
+
+
+def apply_to_rows(rows, ops):
+    """Apply ops to an ID -> cells mapping in place. Replaying an op twice is harmless."""
+    for op in ops:
+        if op.kind == "delete":
+            rows.pop(op.entry_id, None)
+        else:
+            rows[op.entry_id] = op.after
+    return rows
+
+
+def apply_ops(df, ops, columns=LEDGER_COLUMNS):
+    """Return df with ops applied, keeping row order and appending new IDs"""
+    if not ops:
+        return df
+    rows = apply_to_rows(frame_rows(df, columns), ops)
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(list(rows.values()), columns=columns)
@@ -0,0 +1,97 @@
+# ledger_schema.py
+
+import pandas as pd
+
+from sheet_sync import LEDGER_COLUMNS
+
+# Final dtypes of the in-memory ledger
+LEDGER_DTYPES = {
+    "Date": "datetime64[ns]",
+    "Size (mm)": "int32",
+    "Type": "category",
+    "Quantity": "int32",
+    "Remarks": "object",
+    "Status": "category",
+    "Pending": "bool",
+    "ID": "object",
+}
+
+# Listed first so the usual values keep a stable category order
+KNOWN_CATEGORIES = {
+    "Type": ["Inward", "Outgoing"],
+    "Status": ["Current", "Future"],
+}
+
+
+def _pending(values):
+    if values.dtype == bool:
+        return values
+    return values.map(
+        lambda x: str(x).strip().lower() == "true" if isinstance(x, str) else bool(x) and not pd.isna(x)
+    ).astype(bool)
+
+
+def _category(values, known):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    values = values.fillna("").astype(str).str.strip()
+    extra = sorted(set(values.unique()) - set(known))
+    return values.astype(pd.CategoricalDtype(known + extra))
+
+
+def coerce_column(name, values):
+    """One ledger column with its final dtype (already-typed columns pass through)"""
+    dtype = LEDGER_DTYPES[name]
+    if name == "Date":
+        if values.dtype == dtype:
+            return values
+        return pd.to_datetime(values, errors="coerce", format="mixed").dt.normalize().astype(dtype)
+    if dtype == "int32":
+        if values.dtype == dtype:
+            return values
+        return pd.to_numeric(values, errors="coerce").fillna(0).astype(dtype)
+    if dtype == "category":
+        return _category(values, KNOWN_CATEGORIES[name])
+    if dtype == "bool":
+        return _pending(values)
+    return values.fillna("").astype(str).str.strip()
+
+
+def coerce_ledger(df):
+    """The canonical ledger: every column present, in order, with its final dtype.
+
+    Columns that already have their dtype pass through, so it is cheap on
+    a typed frame; the shared ledger runs it once at load and afterwards
+    only on the rows an edit touches.
+    """
+    if df is None:
+        df = pd.DataFrame()
+    out = {}
+    for name in LEDGER_COLUMNS:
+        values = df[name] if name in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+        if name == "Status" and name not in df.columns:
+            values = values.fillna("Current")
+        out[name] = coerce_column(name, values)
+    return pd.DataFrame(out, index=df.index)
+
+
+def concat_ledger(df, rows):
+    """Append raw row dicts to a typed ledger, keeping the dtypes"""
+    new = coerce_ledger(pd.DataFrame(rows))
+    if df is None or df.empty:
+        return new.reset_index(drop=True)
+    combined = pd.concat([df, new], ignore_index=True)
+    for name in LEDGER_COLUMNS:
+        # Mismatched categories come back as object; re-type just those columns
+        if combined[name].dtype != new[name].dtype:
+            combined[name] = coerce_column(name, combined[name])
+    return combined
+
+
+def coerce_value(df, name, value):
+    """A single value ready to store in column name of df (grows categories as needed)"""
+    typed = coerce_column(name, pd.Series([value]))
+    value = typed.iloc[0]
+    if isinstance(df[name].dtype, pd.CategoricalDtype) and value not in df[name].cat.categories:
+        df[name] = df[name].cat.add_categories([value])
+    return value
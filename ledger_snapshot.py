@@ -0,0 +1,56 @@
+# ledger_snapshot.py
+
+import json
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Stored in the Parquet schema metadata next to pandas' own entry
+META_KEY = b"rotor_snapshot"
+
+
+def snapshot_path(directory, name):
+    return os.path.join(directory, f"{name}.parquet")
+
+
+def save_snapshot(directory, name, df, **meta):
+    """Write df as a Parquet snapshot, atomically replacing the previous one.
+
+    meta (e.g. the sheet revision) is kept with the file and comes back
+    from load_snapshot along with saved_at.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta = dict(meta, saved_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Hand-edited sheets can mix numbers and text in one column
+        df = df.copy()
+        for c in df.columns[df.dtypes == object]:
+            df[c] = df[c].map(lambda v: None if v is None or v != v else str(v))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_meta = dict(table.schema.metadata or {})
+    schema_meta[META_KEY] = json.dumps(meta, default=str).encode()
+    table = table.replace_schema_metadata(schema_meta)
+
+    path = snapshot_path(directory, name)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    return meta
+
+
+def load_snapshot(directory, name):
+    """(df, meta) from the last snapshot, or (None, {}) when there is none or it is unreadable"""
+    path = snapshot_path(directory, name)
+    if not os.path.exists(path):
+        return None, {}
+    try:
+        table = pq.read_table(path)
+    except Exception:
+        return None, {}
+    raw = (table.schema.metadata or {}).get(META_KEY)
+    meta = json.loads(raw) if raw else {}
+    return table.to_pandas(), meta
@@ -0,0 +1,194 @@
+# ledger_store.py
+
+import sqlite3
+import threading
+
+import pandas as pd
+
+from ledger_ops import frame_rows
+from sheet_sync import LEDGER_COLUMNS
+
+MATERIAL_TABLES = {
+    "clitting": ["Date", "Size (mm)", "Bags", "Weight per Bag (kg)", "Remarks", "ID"],
+    "lamination_v3": ["Date", "Quantity", "Remarks", "ID"],
+    "lamination_v4": ["Date", "Quantity", "Remarks", "ID"],
+    "stator_usage": [
+        "Date", "Size (mm)", "Quantity", "Remarks",
+        "Estimated Clitting (kg)", "Laminations Used",
+        "Lamination Type", "ID"
+    ],
+}
+
+MOVEMENT_TYPES = {
+    "Date": "TEXT",
+    "Size (mm)": "INTEGER",
+    "Type": "TEXT",
+    "Quantity": "INTEGER",
+    "Remarks": "TEXT",
+    "Status": "TEXT",
+    "Pending": "INTEGER",
+    "ID": "TEXT PRIMARY KEY",
+}
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _pending_flag(value):
+    if isinstance(value, str):
+        return 1 if value.strip().lower() == "true" else 0
+    return 1 if value else 0
+
+
+def _sql_value(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class LedgerStore:
+    """SQLite (WAL) home of the rotor ledger and the material tables.
+
+    Rows keep their insertion order through the implicit rowid, so a
+    ledger read back from here lines up with the Google Sheet mirror.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create()
+
+    def _create(self):
+        cols = ", ".join(f"{_q(c)} {MOVEMENT_TYPES[c]}" for c in LEDGER_COLUMNS)
+        with self._lock:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS movements ({cols})")
+            # ID is covered by its primary key index
+            for column in ["Size (mm)", "Date", "Status"]:
+                index = "idx_movements_" + column.split()[0].lower()
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON movements ({_q(column)})")
+            for table, columns in MATERIAL_TABLES.items():
+                cols = ", ".join(_q(c) for c in columns)
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id ON {table} ({_q('ID')})")
+                if "Size (mm)" in columns:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_size ON {table} ({_q('Size (mm)')})")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date ON {table} ({_q('Date')})")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    # ---- meta ----
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, str(value)),
+            )
+
+    # ---- movements ----
+    def _movement_params(self, cells):
+        return tuple(
+            _pending_flag(cells.get(c)) if c == "Pending" else _sql_value(cells.get(c))
+            for c in LEDGER_COLUMNS
+        )
+
+    def has_movements(self):
+        """True once the ledger has been seeded (even if it is now empty)"""
+        return self.get_meta("movements_seeded") == "1"
+
+    def load_movements(self):
+        """The whole ledger in sheet order, Pending as bool"""
+        cols = ", ".join(_q(c) for c in LEDGER_COLUMNS)
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT {cols} FROM movements ORDER BY rowid", self._conn)
+        df["Pending"] = df["Pending"].fillna(0).astype(bool)
+        df["Remarks"] = df["Remarks"].fillna("")
+        return df
+
+    def replace_movements(self, df):
+        """Overwrite the ledger with df (initial seed or a reload from Sheets)"""
+        rows = [self._movement_params(cells) for cells in frame_rows(df).values()]
+        placeholders = ", ".join("?" for _ in LEDGER_COLUMNS)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM movements")
+                self._conn.executemany(f"INSERT INTO movements VALUES ({placeholders})", rows)
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('movements_seeded', '1') "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def apply_ops(self, ops):
+        """Commit LedgerOps in one transaction"""
+        if not ops:
+            return
+        cols = ", ".join(_q(c) for c in LEDGER_COLUMNS)
+        placeholders = ", ".join("?" for _ in LEDGER_COLUMNS)
+        updates = ", ".join(f"{_q(c)} = excluded.{_q(c)}" for c in LEDGER_COLUMNS if c != "ID")
+        upsert = (
+            f"INSERT INTO movements ({cols}) VALUES ({placeholders}) "
+            f"ON CONFLICT({_q('ID')}) DO UPDATE SET {updates}"
+        )
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for op in ops:
+                    if op.kind == "delete":
+                        self._conn.execute(f"DELETE FROM movements WHERE {_q('ID')} = ?", (op.entry_id,))
+                    else:
+                        self._conn.execute(upsert, self._movement_params(op.after))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---- material tables ----
+    def has_table(self, table):
+        return self.get_meta(f"{table}_seeded") == "1"
+
+    def load_table(self, table):
+        columns = MATERIAL_TABLES[table]
+        cols = ", ".join(_q(c) for c in columns)
+        with self._lock:
+            return pd.read_sql_query(f"SELECT {cols} FROM {table} ORDER BY rowid", self._conn)
+
+    def replace_table(self, table, df):
+        columns = MATERIAL_TABLES[table]
+        df = df.copy()
+        for c in columns:
+            if c not in df.columns:
+                df[c] = None
+        rows = [
+            tuple(_sql_value(v) for v in row)
+            for row in df[columns].itertuples(index=False, name=None)
+        ]
+        placeholders = ", ".join("?" for _ in columns)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(f"DELETE FROM {table}")
+                self._conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, '1') "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (f"{table}_seeded",),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
@@ -0,0 +1,81 @@
+# log_filters.py
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class LogFilters:
+    """Movement Log filter masks, cached per ledger version.
+
+    Each active filter value gets one boolean mask over the ledger,
+    built once per version; a rerun where one filter changed builds just
+    that mask and ANDs it with the cached rest. Columns the filters read
+    in a derived form (lower-cased remarks) are prepared once per version.
+
+    search(df, text), when given, builds the remarks mask instead of a
+    scan of the column (e.g. from a RemarksIndex).
+    """
+
+    def __init__(self, max_masks=64, search=None):
+        self._lock = threading.Lock()
+        self.max_masks = max_masks
+        self.search = search
+        self._version = None
+        self._columns = {}
+        self._masks = {}
+
+    def _column(self, df, name):
+        if name not in self._columns:
+            if name == "remarks":
+                self._columns[name] = df["Remarks"].astype(str).str.lower()
+            elif name == "size":
+                self._columns[name] = df["Size (mm)"].to_numpy()
+            elif name == "date":
+                self._columns[name] = df["Date"].to_numpy(dtype="datetime64[ns]")
+        return self._columns[name]
+
+    def _build(self, df, name, value):
+        if name == "status":
+            return (df["Status"] == value).to_numpy()
+        if name == "type":
+            return (df["Type"] == value).to_numpy()
+        if name == "pending":
+            return df["Pending"].to_numpy(dtype=bool) == (value == "Yes")
+        if name == "sizes":
+            return np.isin(self._column(df, "size"), list(value))
+        if name == "remarks":
+            if self.search is not None:
+                return self.search(df, value)
+            return self._column(df, "remarks").str.contains(value.lower(), regex=False).to_numpy()
+        if name == "dates":
+            start, end = value
+            dates = self._column(df, "date")
+            return (dates >= pd.Timestamp(start).to_datetime64()) & (dates <= pd.Timestamp(end).to_datetime64())
+        raise ValueError(f"Unknown filter: {name}")
+
+    def mask(self, df, version, filters):
+        """Rows of df matching every filter, as a boolean array.
+
+        filters maps a filter name (status, type, pending, sizes, remarks,
+        dates) to its value; None drops the filter. version is the version
+        of the shared ledger and df must be its frame at that version, as
+        masks are reused for any df passed with the same version (None:
+        nothing is cached).
+        """
+        out = np.ones(len(df), dtype=bool)
+        with self._lock:
+            if version is None or version != self._version:
+                self._version, self._columns, self._masks = version, {}, {}
+            for name, value in filters.items():
+                if value is None:
+                    continue
+                key = (name, value)
+                cached = self._masks.get(key)
+                if cached is None or len(cached) != len(df):
+                    if len(self._masks) >= self.max_masks:
+                        self._masks.clear()
+                    cached = self._masks[key] = self._build(df, name, value)
+                out &= cached
+        return out
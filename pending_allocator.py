@@ -0,0 +1,111 @@
+# pending_allocator.py
+
+import threading
+from bisect import bisect_left, insort
+
+from ledger_ops import LedgerOp, row_cells
+from sheet_sync import to_cell
+from stock_aggregates import cell_flag, cell_int
+from stock_index import day_ordinal
+
+
+def buyer_key(remarks):
+    """How remarks are matched to a buyer: whole text, case and spaces ignored"""
+    return str(remarks or "").strip().lower()
+
+
+def _is_open(cells):
+    return cell_flag(cells.get("Pending")) and str(cells.get("Status", "")).strip() == "Current"
+
+
+class PendingAllocator:
+    """Open pending orders as FIFO queues per (size, buyer).
+
+    Orders queue by date, then by ledger order. Dispatches are settled
+    against the queue for their size and buyer only, touching just the
+    orders they use up; apply() keeps the queues in step with the ledger.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        # ID -> (queue key, sort key, sheet cells) for every open order
+        self._orders = {}
+        self._seq = 0
+
+    def rebuild(self, df):
+        queues, orders = {}, {}
+        seq = 0
+        if df is not None and not df.empty:
+            open_rows = df[df["Pending"].fillna(False).astype(bool) & (df["Status"] == "Current")]
+            for seq, row in enumerate(open_rows.to_dict("records")):
+                cells = row_cells(row)
+                self._enter(queues, orders, cells, seq)
+            seq = len(df)
+        with self._lock:
+            self._queues, self._orders, self._seq = queues, orders, seq
+
+    @staticmethod
+    def _enter(queues, orders, cells, seq):
+        key = (cell_int(cells.get("Size (mm)")), buyer_key(cells.get("Remarks")))
+        order = (day_ordinal(cells.get("Date")) or 0, seq, str(cells.get("ID", "")))
+        insort(queues.setdefault(key, []), order)
+        orders[order[2]] = (key, order, cells)
+
+    def _leave(self, entry_id):
+        """Drop an order from its queue; returns its sequence number (None if it was not open)"""
+        found = self._orders.pop(entry_id, None)
+        if found is None:
+            return None
+        key, order, _ = found
+        queue = self._queues[key]
+        del queue[bisect_left(queue, order)]
+        if not queue:
+            del self._queues[key]
+        return order[1]
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                seq = self._leave(op.entry_id)
+                if op.after and _is_open(op.after):
+                    if seq is None:
+                        seq = self._seq
+                        self._seq += 1
+                    self._enter(self._queues, self._orders, dict(op.after, ID=op.entry_id), seq)
+
+    def open_orders(self, size, buyer):
+        """[(ID, quantity)] still open for a size and buyer, oldest first"""
+        with self._lock:
+            queue = self._queues.get((int(size), buyer_key(buyer)), [])
+            return [(entry_id, cell_int(self._orders[entry_id][2].get("Quantity"))) for _, _, entry_id in queue]
+
+    def settle(self, dispatches):
+        """LedgerOps that take each (size, buyer, quantity) dispatch off the oldest open orders.
+
+        Orders used up are deleted, the last one touched is reduced; later
+        dispatches in the batch see what earlier ones took. Nothing changes
+        here until the ops reach apply().
+        """
+        left = {}
+        with self._lock:
+            for size, buyer, qty in dispatches:
+                qty = int(qty)
+                for _, _, entry_id in self._queues.get((int(size), buyer_key(buyer)), []):
+                    if qty <= 0:
+                        break
+                    cells = self._orders[entry_id][2]
+                    have = left.get(entry_id, cell_int(cells.get("Quantity")))
+                    if have <= 0:
+                        continue
+                    take = min(qty, have)
+                    left[entry_id] = have - take
+                    qty -= take
+            ops = []
+            for entry_id, remaining in left.items():
+                before = self._orders[entry_id][2]
+                if remaining <= 0:
+                    ops.append(LedgerOp("delete", entry_id, before, None))
+                else:
+                    ops.append(LedgerOp("update", entry_id, before, dict(before, Quantity=to_cell(remaining))))
+        return ops
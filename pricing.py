@@ -0,0 +1,55 @@
+# pricing.py
+
+import numpy as np
+import pandas as pd
+
+
+class PriceTable:
+    """Price per rotor: the fixed price where one is set, base rate × size otherwise.
+
+    Fixed prices live in a lookup vector indexed by size, so whole columns
+    are priced with one take plus the base-rate fallback. Build a new
+    table when the rates change; the old one is never updated in place.
+    """
+
+    def __init__(self, fixed_prices, base_rate_per_mm):
+        self.fixed_prices = {int(size): price for size, price in fixed_prices.items()}
+        self.base_rate = base_rate_per_mm
+        # Identifies these rates, for caches keyed on pricing
+        self.key = (self.base_rate, tuple(sorted(self.fixed_prices.items())))
+        top = max(self.fixed_prices, default=0)
+        self._vector = np.full(top + 1, np.nan)
+        for size, price in self.fixed_prices.items():
+            if size >= 0:
+                self._vector[size] = price
+
+    def price(self, size):
+        """Price of one rotor of size (0 when size is missing)"""
+        if pd.isna(size):
+            return 0
+        size = int(size)
+        if size in self.fixed_prices:
+            return self.fixed_prices[size]
+        return self.base_rate * size
+
+    def value(self, size, quantity):
+        """Value of quantity rotors of size (0 when either is missing)"""
+        if pd.isna(size) or pd.isna(quantity):
+            return 0
+        return self.price(size) * quantity
+
+    def prices(self, sizes):
+        """Price per rotor for a column of sizes, as a float array (0 where size is missing)"""
+        sizes = pd.to_numeric(pd.Series(sizes), errors="coerce").to_numpy(dtype=float)
+        known = ~np.isnan(sizes)
+        whole = np.where(known, sizes, -1).astype(np.int64)
+        inside = known & (whole >= 0) & (whole < len(self._vector))
+        fixed = np.full(len(sizes), np.nan)
+        fixed[inside] = self._vector[whole[inside]]
+        out = np.where(np.isnan(fixed), self.base_rate * whole, fixed)
+        return np.where(known, out, 0.0)
+
+    def values(self, sizes, quantities):
+        """Value of each (size, quantity) pair in two columns, as a float array"""
+        quantities = pd.to_numeric(pd.Series(quantities), errors="coerce").to_numpy(dtype=float)
+        return np.nan_to_num(self.prices(sizes) * quantities, nan=0.0)
@@ -0,0 +1,86 @@
+# remarks_index.py
+
+import threading
+
+
+def _key(remarks):
+    return "" if remarks is None else str(remarks).lower()
+
+
+def _grams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class RemarksIndex:
+    """Case-insensitive substring and prefix search over Remarks.
+
+    Rows are grouped by their lower-cased remark, and each distinct remark
+    is posted under its trigrams. A search intersects the posting lists of
+    the query's trigrams, checks the few remarks left, and returns their
+    rows' IDs; queries under three characters check every distinct remark,
+    of which there are only as many as buyers and suppliers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._key_of = {}
+        self._postings = {}
+
+    def rebuild(self, df):
+        ids, key_of, postings = {}, {}, {}
+        if df is not None and not df.empty:
+            for entry_id, remarks in zip(df["ID"].tolist(), df["Remarks"].tolist()):
+                key = _key(remarks)
+                key_of[entry_id] = key
+                ids.setdefault(key, set()).add(entry_id)
+            for key in ids:
+                for gram in _grams(key):
+                    postings.setdefault(gram, set()).add(key)
+        with self._lock:
+            self._ids, self._key_of, self._postings = ids, key_of, postings
+
+    def _remove(self, entry_id):
+        key = self._key_of.pop(entry_id, None)
+        if key is None:
+            return
+        rows = self._ids[key]
+        rows.discard(entry_id)
+        if not rows:
+            del self._ids[key]
+            for gram in _grams(key):
+                posted = self._postings[gram]
+                posted.discard(key)
+                if not posted:
+                    del self._postings[gram]
+
+    def _add(self, entry_id, remarks):
+        key = _key(remarks)
+        self._key_of[entry_id] = key
+        if key not in self._ids:
+            self._ids[key] = set()
+            for gram in _grams(key):
+                self._postings.setdefault(gram, set()).add(key)
+        self._ids[key].add(entry_id)
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                self._remove(op.entry_id)
+                if op.after:
+                    self._add(op.entry_id, op.after.get("Remarks", ""))
+
+    def search(self, text, prefix=False):
+        """IDs of rows whose remarks contain text (start with it if prefix), ignoring case"""
+        query = _key(text)
+        with self._lock:
+            grams = sorted((self._postings.get(gram, set()) for gram in _grams(query)), key=len)
+            if grams:
+                candidates = set(grams[0]).intersection(*grams[1:])
+            else:
+                candidates = self._ids.keys()
+            found = set()
+            for key in candidates:
+                if key.startswith(query) if prefix else query in key:
+                    found |= self._ids[key]
+            return found
@@ -0,0 +1,107 @@
+# rollup_cube.py
+
+import threading
+
+import pandas as pd
+
+from stock_aggregates import cell_flag, cell_int
+
+# Columns of a cube slice; the dimensions keep their ledger names so
+# report code can group a slice just like the raw rows
+SLICE_COLUMNS = ["Size (mm)", "Date", "Remarks", "Type", "Status", "Pending", "Rows", "Quantity"]
+
+
+def _day(value):
+    if value is None or value == "":
+        return None
+    day = pd.to_datetime(str(value)[:10], errors="coerce")
+    return None if pd.isna(day) else day
+
+
+class RollupCube:
+    """Row counts and quantity sums per (size, day, party, type, status, pending).
+
+    Cells are grouped by size, so a report on one size only reads that
+    size's cells. The grain is a day rather than a month so date-wise
+    schedules, first/last dates and "last N days" filters stay exact;
+    monthly figures are a groupby of a slice. Values are not stored,
+    since prices can change: price a slice with PriceTable.values.
+    Rows without a date are left out, as the chatbot reports do.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_size = {}
+
+    def rebuild(self, df):
+        by_size = {}
+        if df is not None and not df.empty:
+            dated = df[df["Date"].notna()]
+            groups = pd.DataFrame({
+                "size": dated["Size (mm)"].astype(int),
+                "day": dated["Date"].dt.normalize(),
+                "party": dated["Remarks"].astype(str).str.strip(),
+                "type": dated["Type"].astype(str),
+                "status": dated["Status"].astype(str),
+                "pending": dated["Pending"].astype(bool),
+                "qty": dated["Quantity"].astype(int),
+            }).groupby(["size", "day", "party", "type", "status", "pending"], sort=False)["qty"].agg(["size", "sum"])
+            for (size, *key), rows, qty in zip(groups.index, groups["size"].tolist(), groups["sum"].tolist()):
+                by_size.setdefault(size, {})[tuple(key)] = [rows, qty]
+        with self._lock:
+            self._by_size = by_size
+
+    def _add(self, cells, sign):
+        day = _day(cells.get("Date"))
+        if day is None:
+            return
+        size = cell_int(cells.get("Size (mm)"))
+        key = (
+            day,
+            str(cells.get("Remarks", "")).strip(),
+            str(cells.get("Type", "")).strip(),
+            str(cells.get("Status", "")).strip(),
+            cell_flag(cells.get("Pending")),
+        )
+        size_cells = self._by_size.setdefault(size, {})
+        cell = size_cells.setdefault(key, [0, 0])
+        cell[0] += sign
+        cell[1] += sign * cell_int(cells.get("Quantity"))
+        if cell[0] <= 0:
+            del size_cells[key]
+            if not size_cells:
+                del self._by_size[size]
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                if op.before:
+                    self._add(op.before, -1)
+                if op.after:
+                    self._add(op.after, 1)
+
+    def slice(self, size=None, kind=None, status=None, pending=None, since=None):
+        """Cells matching every given dimension, as a DataFrame with SLICE_COLUMNS.
+
+        since keeps days on or after it (compared like Date >= since).
+        """
+        with self._lock:
+            if size is None:
+                sources = list(self._by_size.items())
+            else:
+                sources = [(int(size), self._by_size.get(int(size), {}))]
+            rows = [
+                (s, day, party, t, st, p, cell[0], cell[1])
+                for s, size_cells in sources
+                for (day, party, t, st, p), cell in size_cells.items()
+                if (kind is None or t == kind)
+                and (status is None or st == status)
+                and (pending is None or p == pending)
+            ]
+        out = pd.DataFrame(rows, columns=SLICE_COLUMNS).astype({
+            "Size (mm)": "int64", "Pending": bool, "Rows": "int64", "Quantity": "int64",
+        })
+        out["Date"] = pd.to_datetime(out["Date"])
+        if since is not None:
+            out = out[out["Date"] >= since]
+        return out.sort_values(["Size (mm)", "Date"], kind="stable").reset_index(drop=True)
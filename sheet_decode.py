@@ -0,0 +1,118 @@
+# sheet_decode.py
+
+import numpy as np
+import pandas as pd
+
+# Ask for raw cell values; dates come back as serial day numbers
+UNFORMATTED = {
+    "valueRenderOption": "UNFORMATTED_VALUE",
+    "dateTimeRenderOption": "SERIAL_NUMBER",
+}
+
+# Day zero of Sheets serial dates
+SERIAL_EPOCH = np.datetime64("1899-12-30")
+
+# Column kinds per table. Kinds: "date" (datetime64), "date_text"
+# ('YYYY-MM-DD' strings), "int32", "int", "float", "bool", "category", "text".
+MOVEMENT_SCHEMA = {
+    "Date": "date",
+    "Size (mm)": "int32",
+    "Type": "category",
+    "Quantity": "int32",
+    "Remarks": "text",
+    "Status": "category",
+    "Pending": "bool",
+    "ID": "text",
+}
+
+MATERIAL_SCHEMAS = {
+    "clitting": {
+        "Date": "date_text",
+        "Size (mm)": "int",
+        "Bags": "int",
+        "Weight per Bag (kg)": "float",
+        "Remarks": "text",
+        "ID": "text",
+    },
+    "lamination_v3": {"Date": "date_text", "Quantity": "int", "Remarks": "text", "ID": "text"},
+    "lamination_v4": {"Date": "date_text", "Quantity": "int", "Remarks": "text", "ID": "text"},
+    "stator_usage": {
+        "Date": "date_text",
+        "Size (mm)": "int",
+        "Quantity": "int",
+        "Remarks": "text",
+        "Estimated Clitting (kg)": "float",
+        "Laminations Used": "int",
+        "Lamination Type": "text",
+        "ID": "text",
+    },
+}
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _dates(cells):
+    numeric = np.fromiter((_is_number(v) for v in cells), dtype=bool, count=len(cells))
+    out = np.full(len(cells), np.datetime64("NaT"), dtype="datetime64[ns]")
+    if numeric.any():
+        days = cells[numeric].astype("float64").astype("int64")
+        out[numeric] = (SERIAL_EPOCH + days.astype("timedelta64[D]")).astype("datetime64[ns]")
+    if (~numeric).any():
+        text = pd.to_datetime(pd.Series(cells[~numeric], dtype=object), errors="coerce", format="mixed")
+        out[~numeric] = text.dt.normalize().to_numpy(dtype="datetime64[ns]")
+    return out
+
+
+def _numbers(cells):
+    return pd.to_numeric(pd.Series(cells, dtype=object).replace("", np.nan), errors="coerce").to_numpy(dtype="float64")
+
+
+def _text(cells):
+    return np.array(["" if v is None else str(v).strip() for v in cells], dtype=object)
+
+
+def decode_column(cells, kind):
+    """Typed array for one column of raw cells (an object ndarray)"""
+    if kind == "date":
+        return _dates(cells)
+    if kind == "date_text":
+        dates = pd.Series(_dates(cells))
+        return dates.dt.strftime("%Y-%m-%d").fillna("").to_numpy(dtype=object)
+    if kind in ("int32", "int"):
+        return np.nan_to_num(_numbers(cells), nan=0).astype(np.int32 if kind == "int32" else np.int64)
+    if kind == "float":
+        return _numbers(cells)
+    if kind == "bool":
+        return np.fromiter(
+            (v if isinstance(v, bool) else str(v).strip().lower() == "true" for v in cells),
+            dtype=bool, count=len(cells),
+        )
+    if kind == "category":
+        return pd.Categorical(_text(cells))
+    return _text(cells)
+
+
+def decode_values(values, schema):
+    """DataFrame from raw sheet values (header row first), typed per schema.
+
+    Declared columns missing from the sheet are left out; undeclared ones
+    are kept as raw objects. Returns None when there are no data rows.
+    """
+    if len(values) < 2:
+        return None
+    header = [str(h) for h in values[0]]
+    width = len(header)
+    grid = np.empty((len(values) - 1, width), dtype=object)
+    grid[:] = ""
+    for i, row in enumerate(values[1:]):
+        row = row[:width]
+        grid[i, :len(row)] = row
+    columns = {}
+    for j, name in enumerate(header):
+        if not name:
+            continue
+        kind = schema.get(name)
+        columns[name] = grid[:, j] if kind is None else decode_column(grid[:, j], kind)
+    return pd.DataFrame(columns)
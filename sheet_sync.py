@@ -0,0 +1,183 @@
+# sheet_sync.py
+
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+LEDGER_COLUMNS = ['Date', 'Size (mm)', 'Type', 'Quantity', 'Remarks', 'Status', 'Pending', 'ID']
+
+# appended: rows to add at the bottom
+# updated: (first sheet row, [rows]) blocks of contiguous changed rows
+# deleted: (first sheet row, last sheet row) blocks, bottom-up
+# order: IDs in the order they sit on the sheet once the diff is applied
+LedgerDiff = namedtuple("LedgerDiff", ["appended", "updated", "deleted", "order"])
+
+# Last state written to (or read from) each worksheet, shared by every
+# session in the process so row positions stay correct across reruns.
+_synced = {}
+_synced_lock = threading.Lock()
+
+
+def to_cell(value):
+    """Convert a ledger value to what the sheet stores"""
+    if value is None:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return "" if pd.isna(value) else value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if np.isnan(value):
+            return ""
+        if value.is_integer():
+            return int(value)
+    if value is pd.NaT or value is pd.NA:
+        return ""
+    return value
+
+
+def to_sheet_rows(df, columns=LEDGER_COLUMNS):
+    """Serialize a ledger DataFrame into sheet rows"""
+    df = df.copy()
+    for c in columns:
+        if c not in df.columns:
+            df[c] = ""
+    return [[to_cell(v) for v in row] for row in df[columns].itertuples(index=False, name=None)]
+
+
+def _sheet_key(ws):
+    return (ws.spreadsheet.id, ws.id)
+
+
+def remember_synced(ws, df, columns=LEDGER_COLUMNS):
+    """Record the ledger as the current contents of a worksheet"""
+    if df is None or list(df.columns) != list(columns):
+        forget_synced(ws)
+        return
+    rows = to_sheet_rows(df, columns)
+    with _synced_lock:
+        _synced[_sheet_key(ws)] = (list(columns), rows)
+
+
+def forget_synced(ws):
+    """Drop the recorded state so the next save rewrites the worksheet"""
+    with _synced_lock:
+        _synced.pop(_sheet_key(ws), None)
+
+
+def _blocks(rows):
+    """Group sorted row numbers into (first, last) runs"""
+    blocks = []
+    for r in rows:
+        if blocks and r == blocks[-1][1] + 1:
+            blocks[-1][1] = r
+        else:
+            blocks.append([r, r])
+    return [tuple(b) for b in blocks]
+
+
+def diff_ledger(synced_rows, current_rows, columns=LEDGER_COLUMNS, key="ID"):
+    """Diff two lists of sheet rows by ID. Returns None when a full rewrite is needed."""
+    k = columns.index(key)
+    synced_ids = [row[k] for row in synced_rows]
+    current_ids = [row[k] for row in current_rows]
+    if "" in current_ids or len(set(current_ids)) != len(current_ids):
+        return None
+    if len(set(synced_ids)) != len(synced_ids):
+        return None
+
+    pos = {entry_id: i for i, entry_id in enumerate(synced_ids)}
+    current_by_id = dict(zip(current_ids, current_rows))
+
+    changed = []
+    appended = []
+    for entry_id, row in zip(current_ids, current_rows):
+        i = pos.get(entry_id)
+        if i is None:
+            appended.append(row)
+        elif synced_rows[i] != row:
+            changed.append(i + 2)  # +1 for 1-based rows, +1 for the header
+
+    deleted_rows = [i + 2 for i, entry_id in enumerate(synced_ids) if entry_id not in current_by_id]
+
+    updated = []
+    for first, last in _blocks(changed):
+        updated.append((first, [current_by_id[synced_ids[r - 2]] for r in range(first, last + 1)]))
+    deleted = list(reversed(_blocks(deleted_rows)))
+
+    order = [entry_id for entry_id in synced_ids if entry_id in current_by_id]
+    order += [row[k] for row in appended]
+    return LedgerDiff(appended, updated, deleted, order)
+
+
+def apply_diff(ws, diff, width):
+    """Send a LedgerDiff to a worksheet: one batch update, one delete batch, one append"""
+    if diff.updated:
+        ws.batch_update([
+            {
+                "range": f"{rowcol_to_a1(first, 1)}:{rowcol_to_a1(first + len(rows) - 1, width)}",
+                "values": rows,
+            }
+            for first, rows in diff.updated
+        ])
+    if diff.deleted:
+        ws.spreadsheet.batch_update({"requests": [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": ws.id,
+                        "dimension": "ROWS",
+                        "startIndex": first - 1,
+                        "endIndex": last,
+                    }
+                }
+            }
+            for first, last in diff.deleted
+        ]})
+    if diff.appended:
+        ws.append_rows(diff.appended, table_range="A1")
+
+
+def sync_ledger(ws, df, columns=LEDGER_COLUMNS, key="ID"):
+    """Bring a worksheet in line with df, sending only the rows that changed.
+
+    Falls back to clear-and-rewrite when nothing is known about the
+    worksheet yet or the rows cannot be matched by ID.
+    Returns the number of rows written or deleted.
+    """
+    rows = to_sheet_rows(df, columns)
+    with _synced_lock:
+        synced = _synced.get(_sheet_key(ws))
+
+    diff = None
+    if synced is not None and synced[0] == list(columns):
+        diff = diff_ledger(synced[1], rows, columns, key)
+
+    try:
+        if diff is None:
+            ws.clear()
+            ws.update([list(columns)] + rows)
+            new_rows = rows
+            cost = len(rows)
+        else:
+            apply_diff(ws, diff, len(columns))
+            k = columns.index(key)
+            by_id = {row[k]: row for row in rows}
+            new_rows = [by_id[entry_id] for entry_id in diff.order]
+            cost = len(diff.appended) + sum(len(r) for _, r in diff.updated) + sum(
+                last - first + 1 for first, last in diff.deleted
+            )
+    except Exception:
+        # Half-applied diffs leave positions unknown; rewrite next time
+        forget_synced(ws)
+        raise
+
+    with _synced_lock:
+        _synced[_sheet_key(ws)] = (list(columns), new_rows)
+    return cost
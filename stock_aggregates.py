@@ -0,0 +1,122 @@
+# stock_aggregates.py
+
+import threading
+
+import pandas as pd
+
+from ledger_math import stock_totals
+
+# Per-size totals: [rows, stock, pending out, coming in, future, pending outgoing]
+ROWS, STOCK, PENDING, COMING, FUTURE, ORDERS = range(6)
+
+
+def cell_int(value):
+    """Integer from a sheet cell (0 when blank or not a number)"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def cell_flag(value):
+    """Boolean from a sheet cell ('TRUE'/'FALSE' text or a real bool)"""
+    if isinstance(value, str):
+        return value.strip().lower() == "true"
+    return bool(value)
+
+
+def contribution(cells):
+    """(size, [rows, stock, pending, coming, future, orders]) one ledger row adds to its size.
+
+    Stock counts current, non-pending rows (Inward adds, anything else
+    takes away); pending out is current pending rows; coming in is future
+    Inward rows. The Stock Summary counts every future row as coming, and
+    the assistants count pending Outgoing rows of either status as
+    pending orders, so those are kept as well.
+    """
+    size = cell_int(cells.get("Size (mm)"))
+    qty = cell_int(cells.get("Quantity"))
+    kind = str(cells.get("Type", "")).strip()
+    status = str(cells.get("Status", "")).strip()
+    pending = cell_flag(cells.get("Pending"))
+    delta = [1, 0, 0, 0, 0, 0]
+    if status == "Current":
+        if pending:
+            delta[PENDING] = qty
+        else:
+            delta[STOCK] = qty if kind == "Inward" else -qty
+    elif status == "Future":
+        delta[FUTURE] = qty
+        if kind == "Inward":
+            delta[COMING] = qty
+    if kind == "Outgoing" and pending:
+        delta[ORDERS] = qty
+    return size, delta
+
+
+class StockAggregates:
+    """Stock, pending out and coming in per Size (mm), kept current from ledger ops.
+
+    rebuild() does one pass over a ledger; apply() adjusts only the sizes
+    an op touches, so reads never scan the ledger.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_size = {}
+
+    def rebuild(self, df):
+        by_size = {}
+        if df is not None and not df.empty:
+            totals = stock_totals(df)
+            # Columns: Size (mm), Rows, Stock, Pending Out, Coming In, Future, Pending Outgoing
+            for size, *row in totals.itertuples(index=False, name=None):
+                by_size[int(size)] = [int(v) for v in row]
+        with self._lock:
+            self._by_size = by_size
+
+    def _add(self, cells, sign):
+        size, delta = contribution(cells)
+        totals = self._by_size.setdefault(size, [0] * len(delta))
+        for i, d in enumerate(delta):
+            totals[i] += sign * d
+        if totals[ROWS] <= 0:
+            del self._by_size[size]
+
+    def apply(self, ops):
+        """Fold LedgerOps in: take out each op's before row, add its after row"""
+        with self._lock:
+            for op in ops:
+                if op.before:
+                    self._add(op.before, -1)
+                if op.after:
+                    self._add(op.after, 1)
+
+    def totals(self, size):
+        """{'stock', 'pending_out', 'coming_in', 'future', 'pending_outgoing'} for one size (zeros if unknown)"""
+        with self._lock:
+            t = self._by_size.get(int(size), [0] * 6)
+        return {
+            "stock": t[STOCK],
+            "pending_out": t[PENDING],
+            "coming_in": t[COMING],
+            "future": t[FUTURE],
+            "pending_outgoing": t[ORDERS],
+        }
+
+    def sizes(self):
+        with self._lock:
+            return sorted(self._by_size)
+
+    def frame(self, price_of=None):
+        """One row per size in the ledger, sorted: Size (mm), Stock, Pending Out, Coming In,
+        Future, Pending Outgoing (+ Value)"""
+        with self._lock:
+            items = sorted(self._by_size.items())
+        df = pd.DataFrame(
+            [(size, t[STOCK], t[PENDING], t[COMING], t[FUTURE], t[ORDERS]) for size, t in items],
+            columns=["Size (mm)", "Stock", "Pending Out", "Coming In", "Future", "Pending Outgoing"],
+        ).astype("int64")
+        if price_of is not None:
+            df["Value"] = [price_of(size) * stock for size, stock in zip(df["Size (mm)"], df["Stock"])]
+        return df
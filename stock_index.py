@@ -0,0 +1,187 @@
+# stock_index.py
+
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from ledger_math import signed_quantity, stock_mask
+from stock_aggregates import STOCK, contribution
+
+# date.toordinal() of 1970-01-01, to turn datetime64 days into ordinals
+_EPOCH_ORDINAL = 719163
+# Room left around the known dates so most backdated or forward-dated
+# entries land inside the tree without a rebuild
+_SLACK_BEFORE = 31
+_SLACK_AFTER = 366
+
+
+def day_ordinal(value):
+    """date.toordinal() of a date-like cell, or None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (datetime, date)):
+        return None if pd.isna(value) else value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        ts = pd.to_datetime(value, errors="coerce")
+        return None if pd.isna(ts) else ts.toordinal()
+
+
+class BalanceTree:
+    """Stock balance for each day of [lo, lo + cap) as a min segment tree.
+
+    A movement on day d adds to every balance from d on (a suffix range
+    add); balance on a day and the lowest balance over a range are both
+    O(log cap). Lazy adds stay on their node and are summed on the way
+    down, so nothing is ever pushed to children.
+    """
+
+    def __init__(self, lo, cap, deltas):
+        self.lo = lo
+        self.cap = cap
+        daily = np.zeros(cap, dtype=np.int64)
+        days = np.fromiter(deltas.keys(), dtype=np.int64, count=len(deltas))
+        np.add.at(daily, days - lo, np.fromiter(deltas.values(), dtype=np.int64, count=len(deltas)))
+        self.mn = np.zeros(2 * cap, dtype=np.int64)
+        self.lz = np.zeros(2 * cap, dtype=np.int64)
+        self.mn[cap:] = np.cumsum(daily)
+        width = cap // 2
+        while width:
+            self.mn[width:2 * width] = np.minimum(self.mn[2 * width:4 * width:2], self.mn[2 * width + 1:4 * width:2])
+            width //= 2
+
+    def covers(self, day):
+        return self.lo <= day < self.lo + self.cap
+
+    def _add(self, node, nl, nr, l, r, v):
+        if r < nl or nr < l:
+            return
+        if l <= nl and nr <= r:
+            self.mn[node] += v
+            self.lz[node] += v
+            return
+        mid = (nl + nr) // 2
+        self._add(2 * node, nl, mid, l, r, v)
+        self._add(2 * node + 1, mid + 1, nr, l, r, v)
+        self.mn[node] = min(self.mn[2 * node], self.mn[2 * node + 1]) + self.lz[node]
+
+    def _min(self, node, nl, nr, l, r):
+        if r < nl or nr < l:
+            return None
+        if l <= nl and nr <= r:
+            return int(self.mn[node])
+        mid = (nl + nr) // 2
+        left = self._min(2 * node, nl, mid, l, r)
+        right = self._min(2 * node + 1, mid + 1, nr, l, r)
+        best = right if left is None else left if right is None else min(left, right)
+        return best + int(self.lz[node])
+
+    def add(self, day, qty):
+        """Record qty moving on day (must be covered)"""
+        self._add(1, 0, self.cap - 1, day - self.lo, self.cap - 1, qty)
+
+    def balance(self, day):
+        """Balance at the end of day"""
+        if day < self.lo:
+            return 0
+        i = min(day - self.lo, self.cap - 1)
+        return self._min(1, 0, self.cap - 1, i, i)
+
+    def lowest(self, first, last):
+        """Lowest end-of-day balance from first to last (inclusive)"""
+        values = []
+        if first < self.lo:
+            values.append(0)
+        l, r = max(first, self.lo) - self.lo, min(last - self.lo, self.cap - 1)
+        if l <= r:
+            values.append(self._min(1, 0, self.cap - 1, l, r))
+        elif last >= self.lo + self.cap:
+            values.append(self.balance(last))
+        return min(values) if values else 0
+
+
+def _tree_for(deltas):
+    live = {d: q for d, q in deltas.items() if q}
+    if not live:
+        return None
+    lo = min(live) - _SLACK_BEFORE
+    need = max(live) - lo + 1 + _SLACK_AFTER
+    cap = 1 << (need - 1).bit_length()
+    return BalanceTree(lo, cap, live)
+
+
+class StockIndex:
+    """Point-in-time stock per Size (mm), built from dated stock movements.
+
+    Only rows that count as stock (current, not pending) are indexed.
+    Inserts, edits and deletes on any date, backdated or not, cost
+    O(log days); a date outside a size's tree rebuilds just that size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = {}
+        self._trees = {}
+
+    def rebuild(self, df):
+        deltas = {}
+        if df is not None and not df.empty:
+            mask = stock_mask(df) & df["Date"].notna().to_numpy()
+            if mask.any():
+                days = df["Date"].to_numpy()[mask].astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+                moves = pd.DataFrame({
+                    "size": df["Size (mm)"].to_numpy()[mask].astype(np.int64),
+                    "day": days,
+                    "qty": signed_quantity(df)[mask],
+                }).groupby(["size", "day"])["qty"].sum()
+                for size, part in moves.groupby(level=0):
+                    deltas[int(size)] = dict(zip(part.index.get_level_values(1).tolist(), part.tolist()))
+        trees = {size: _tree_for(d) for size, d in deltas.items()}
+        with self._lock:
+            self._deltas = deltas
+            self._trees = trees
+
+    def _move(self, cells, sign):
+        size, delta = contribution(cells)
+        qty = delta[STOCK] * sign
+        day = day_ordinal(cells.get("Date"))
+        if not qty or day is None:
+            return
+        deltas = self._deltas.setdefault(size, {})
+        deltas[day] = deltas.get(day, 0) + qty
+        tree = self._trees.get(size)
+        if tree is not None and tree.covers(day):
+            tree.add(day, qty)
+        else:
+            self._trees[size] = _tree_for(deltas)
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                if op.before:
+                    self._move(op.before, -1)
+                if op.after:
+                    self._move(op.after, 1)
+
+    def stock_as_of(self, size, when):
+        """Stock of a size at the end of the day when"""
+        with self._lock:
+            tree = self._trees.get(int(size))
+            return 0 if tree is None else tree.balance(day_ordinal(when))
+
+    def lowest_stock(self, size, first, last):
+        """Lowest end-of-day stock of a size between two dates (inclusive)"""
+        with self._lock:
+            tree = self._trees.get(int(size))
+            return 0 if tree is None else tree.lowest(day_ordinal(first), day_ordinal(last))
+
+    def timeline(self, size, dates):
+        """Stock at the end of each of dates, as a list"""
+        with self._lock:
+            tree = self._trees.get(int(size))
+            if tree is None:
+                return [0] * len(dates)
+            return [tree.balance(day_ordinal(d)) for d in dates]
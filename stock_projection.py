@@ -0,0 +1,66 @@
+# stock_projection.py
+
+import numpy as np
+import pandas as pd
+
+from ledger_math import (
+    SIZE, coming_mask, pending_mask, pending_outgoing_mask, quantity, signed_quantity, stock_mask,
+)
+
+
+def project_stock(df, today=None):
+    """Projected stock per size after every day something is due to move.
+
+    Stock on hand counts today; future Inward rows arrive on their date
+    and pending rows go out on theirs, current rows and future Outgoing
+    orders alike (anything overdue or undated is due today). Columns:
+    Size (mm), Date, Change, Projected Stock, sorted by size and date. One sweep over all sizes: sort the events, then a
+    grouped cumulative sum.
+    """
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.now()).normalize()
+    columns = [SIZE, "Date", "Change", "Projected Stock"]
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columns)
+
+    qty = quantity(df)
+    stock = stock_mask(df)
+    coming = coming_mask(df)
+    pending = pending_mask(df) | pending_outgoing_mask(df)
+    change = np.select([stock, coming, pending], [signed_quantity(df), qty, -qty], 0)
+    dates = df["Date"].to_numpy(dtype="datetime64[ns]")
+    due = np.where(stock | np.isnat(dates), today.to_datetime64(), np.maximum(dates, today.to_datetime64()))
+
+    moving = stock | coming | pending
+    events = pd.DataFrame({
+        SIZE: df[SIZE].to_numpy()[moving].astype(np.int64),
+        "Date": due[moving],
+        "Change": change[moving],
+    })
+    events = events.groupby([SIZE, "Date"], sort=True)["Change"].sum().reset_index()
+    events["Projected Stock"] = events.groupby(SIZE)["Change"].cumsum()
+    return events[columns]
+
+
+def first_stockouts(projection):
+    """First day each size is projected below zero.
+
+    Columns: Size (mm), Stockout Date, Projected Stock (on that day),
+    Lowest (the deepest shortfall ahead); sizes that never run out are left out.
+    """
+    short = projection[projection["Projected Stock"] < 0]
+    first = short.groupby(SIZE, sort=True).first().reset_index()
+    lowest = short.groupby(SIZE)["Projected Stock"].min()
+    return pd.DataFrame({
+        SIZE: first[SIZE],
+        "Stockout Date": first["Date"],
+        "Projected Stock": first["Projected Stock"],
+        "Lowest": first[SIZE].map(lowest).to_numpy(),
+    })
+
+
+def daily_projection(projection, size, days=90, today=None):
+    """Projected stock of one size for each of the next days (a Series indexed by date)"""
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.now()).normalize()
+    calendar = pd.date_range(today, periods=days, freq="D")
+    steps = projection.loc[projection[SIZE] == int(size)].set_index("Date")["Projected Stock"]
+    return steps.reindex(calendar, method="ffill").fillna(0).astype(int)
@@ -0,0 +1,76 @@
+# view_router.py
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class ViewRouter:
+    """Bookkeeping for views that run only while they are on screen.
+
+    memo() keeps what recently shown views computed in a small LRU, keyed
+    by view and whatever the value depends on (usually the ledger
+    version), so switching back to a view doesn't recompute it. timed()
+    wraps a view so every run of it, fragment reruns included, is timed
+    (and optionally reported).
+    """
+
+    def __init__(self, max_entries=8):
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._timings = {}
+
+    def memo(self, view, key, build):
+        """build()'s value for (view, key), reused while it stays among the most recent entries.
+
+        A key of None is never cached.
+        """
+        if key is None:
+            return build()
+        slot = (view, key)
+        with self._lock:
+            if slot in self._memo:
+                self._memo.move_to_end(slot)
+                return self._memo[slot]
+        value = build()
+        with self._lock:
+            self._memo[slot] = value
+            self._memo.move_to_end(slot)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return value
+
+    def timed(self, view, report=None):
+        """Decorator recording how long each run of the view's function takes.
+
+        report(view, timing), when given, is called after each run that
+        returns, inside the wrapped call (so inside its fragment).
+        """
+        def decorate(func):
+            @wraps(func)
+            def run(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    self._record(view, time.perf_counter() - start)
+                if report is not None:
+                    report(view, self.timing(view))
+                return result
+            return run
+        return decorate
+
+    def _record(self, view, seconds):
+        with self._lock:
+            runs, total, _ = self._timings.get(view, (0, 0.0, 0.0))
+            self._timings[view] = (runs + 1, total + seconds, seconds)
+
+    def timing(self, view):
+        """{"runs", "last_ms", "avg_ms"} for a view (None before its first run)"""
+        with self._lock:
+            if view not in self._timings:
+                return None
+            runs, total, last = self._timings[view]
+        return {"runs": runs, "last_ms": last * 1000, "avg_ms": total / runs * 1000}
@@ -0,0 +1,183 @@
+# write_behind.py
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from ledger_ops import LedgerOp
+
+
+class LedgerJournal:
+    """Append-only JSON-lines journal of ledger ops not yet flushed to Sheets.
+
+    Each op is written and fsynced before the UI carries on, so a crash or
+    restart only ever loses the Sheets round trip, never the edit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._flushed = 0
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn final write; everything before it is intact
+                if "flushed" in record:
+                    self._flushed = max(self._flushed, record["flushed"])
+                else:
+                    self._seq = max(self._seq, record["seq"])
+                    self._pending.append(record)
+        self._pending = [r for r in self._pending if r["seq"] > self._flushed]
+        # A compacted file may hold only the flushed marker; keep counting from it
+        self._seq = max(self._seq, self._flushed)
+
+    def _write(self, records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, ops):
+        """Durably record ops and return the sequence number of the last one"""
+        with self._lock:
+            if not ops:
+                return self._seq
+            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            records = []
+            for op in ops:
+                self._seq += 1
+                records.append({
+                    "seq": self._seq,
+                    "ts": ts,
+                    "op": op.kind,
+                    "id": op.entry_id,
+                    "before": op.before,
+                    "row": op.after,
+                })
+            self._write(records)
+            self._pending.extend(records)
+            return self._seq
+
+    def mark_flushed(self, seq):
+        """Record that everything up to seq is on the sheet"""
+        with self._lock:
+            if seq <= self._flushed:
+                return
+            self._flushed = seq
+            self._pending = [r for r in self._pending if r["seq"] > seq]
+            if self._pending:
+                self._write([{"flushed": seq}])
+            else:
+                # Nothing left to replay: start a fresh file
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"flushed": seq}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def pending_ops(self):
+        """Unflushed ops, oldest first"""
+        with self._lock:
+            return [
+                LedgerOp(r["op"], r["id"], r.get("before"), r.get("row"))
+                for r in self._pending
+            ]
+
+    def pending_records(self, upto):
+        """Raw journal records (with timestamps) up to seq, oldest first"""
+        with self._lock:
+            return [dict(r) for r in self._pending if r["seq"] <= upto]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def last_seq(self):
+        with self._lock:
+            return self._seq
+
+
+class SheetWriter:
+    """Background thread that flushes the newest ledger to Google Sheets.
+
+    submit() only stores the latest frame; the thread waits until edits
+    have been quiet for `delay` seconds and then makes one flush for the
+    whole burst. flush(df, records) also gets the journal records the
+    burst covers. Failed flushes are retried with backoff.
+    """
+
+    def __init__(self, journal, flush, delay=2.0, max_backoff=60.0):
+        self.journal = journal
+        self._flush = flush
+        self.delay = delay
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._latest = None
+        self._latest_seq = 0
+        self._last_submit = 0.0
+        self.last_flush = None
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, df, seq):
+        """Queue df (already journaled up to seq) for the next flush"""
+        with self._cond:
+            self._latest = df
+            self._latest_seq = max(self._latest_seq, seq)
+            self._last_submit = time.monotonic()
+            self._cond.notify()
+
+    def status(self):
+        """'pending' while journaled edits are not yet on the sheet, else 'synced'"""
+        return {
+            "state": "pending" if self.journal.pending_count() else "synced",
+            "pending": self.journal.pending_count(),
+            "last_flush": self.last_flush,
+            "error": self.last_error,
+        }
+
+    def _run(self):
+        backoff = self.delay
+        while True:
+            with self._cond:
+                while self._latest is None:
+                    self._cond.wait()
+                # Let a burst of edits settle into one flush
+                while True:
+                    quiet = time.monotonic() - self._last_submit
+                    if quiet >= self.delay:
+                        break
+                    self._cond.wait(self.delay - quiet)
+                df, seq = self._latest, self._latest_seq
+                self._latest = None
+
+            try:
+                self._flush(df, self.journal.pending_records(seq))
+            except Exception as e:
+                self.last_error = str(e)
+                with self._cond:
+                    if self._latest is None:
+                        self._latest = df
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = self.delay
+            self.last_error = None
+            self.last_flush = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.journal.mark_flushed(seq)